@@ -1,15 +1,26 @@
 """Define the entities."""
 
+import ast
 import importlib.util
 import inspect
 import os
 import re
-from typing import Any, Dict, List, Optional, Tuple
+import sys
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Pattern, Set, Tuple
 
-import autoflake
-from pyflakes.messages import UndefinedExport, UndefinedName, UnusedImport
+from pyflakes import checker
+from pyflakes.messages import Message, UndefinedExport, UndefinedName, UnusedImport
 from pyprojroot import here
 
+_HEADER_LINE = re.compile(
+    r'(?P<single_line_docstring>"{3}.*"{3})|(?P<docstring>"{3})|(?P<comment>#)'
+    r"|(?P<empty>$)"
+)
+_IMPORT_LINE = re.compile(r"^\s*(from .*)?import.[^\'\"]*$")
+_MOVE_IMPORT = re.compile(r"^\s*(?:from .*)?import .[^\'\"]*$")
+_FROM_IMPORT = re.compile(r"\s*from .* import")
+
 common_statements: Dict[str, str] = {
     "ABC": "from abc import ABC",
     "abstractmethod": "from abc import abstractmethod",
@@ -52,7 +63,13 @@ class SourceCode:  # noqa: R090
         self.typing: List[str] = []
         self.code: List[str] = []
         self.config: Dict[str, Any] = config if config else {}
+        self._common_statements: Dict[str, str] = {
+            **common_statements,
+            **(self._get_additional_statements() or {}),
+        }
         self._trailing_newline = False
+        # Cache of the joined source code, None when the sections have changed.
+        self._joined_code: Optional[str] = None
         self._split_code(source_code)
 
     def fix(self) -> str:
@@ -82,112 +99,135 @@ class SourceCode:  # noqa: R090
         """
         source_code_lines = source_code.splitlines()
 
-        self._extract_header(source_code_lines)
-        self._extract_import_statements(source_code_lines)
-        self._extract_typing_statements(source_code_lines)
-        self._extract_code(source_code_lines)
+        import_start, typing_start, code_start = self._classify_lines(source_code_lines)
+        self.header = source_code_lines[:import_start]
+        self.imports = source_code_lines[import_start:typing_start]
+        self.typing = source_code_lines[typing_start:code_start]
+        self.code = source_code_lines[code_start:]
         if source_code.endswith("\n"):
             self._trailing_newline = True
 
-    def _extract_header(self, source_lines: List[str]) -> None:
-        """Save the module leading comments and docstring from the source code.
+    def _classify_lines(self, source_lines: List[str]) -> Tuple[int, int, int]:
+        """Find where each section of the source code starts.
 
-        Save them into self.header.
+        The lines are scanned once, each section search starts where the previous
+        one ended.
 
         Args:
             source_lines: A list containing all code lines.
+
+        Returns:
+            import_start: Index of the first line of the import statements.
+            typing_start: Index of the first line of the typing statements.
+            code_start: Index of the first line of the code.
         """
-        docstring_type: Optional[str] = None
+        import_start = self._find_header_end(source_lines)
+        typing_start = self._find_import_statements_end(source_lines, import_start)
+        code_start = self._find_typing_statements_end(source_lines, typing_start)
+        return import_start, typing_start, code_start
 
-        for line in source_lines:
-            if re.match(r'"{3}.*"{3}', line):
-                # Match single line docstrings.
-                self.header.append(line)
-                break
+    @staticmethod
+    def _find_header_end(source_lines: List[str]) -> int:
+        """Find the end of the module leading comments and docstring.
+
+        Args:
+            source_lines: A list containing all code lines.
+
+        Returns:
+            Index of the first line after the header.
+        """
+        docstring_type: Optional[str] = None
 
-            if docstring_type == "start_multiple_lines" and re.match(r'""" ?', line):
-                # Match end of multiple line docstrings
-                docstring_type = "multiple_lines"
-            elif re.match(r'"{3}.*', line):
-                # Match multiple line docstrings start
-                docstring_type = "start_multiple_lines"
-            elif re.match(r"#.*", line) or line == "":
+        for line_num, line in enumerate(source_lines):
+            match = _HEADER_LINE.match(line)
+            line_type = match.lastgroup if match is not None else None
+
+            if line_type == "single_line_docstring":
+                return line_num + 1
+
+            if line_type == "docstring":
+                if docstring_type == "start_multiple_lines":
+                    # Match end of multiple line docstrings
+                    docstring_type = "multiple_lines"
+                else:
+                    # Match multiple line docstrings start
+                    docstring_type = "start_multiple_lines"
+            elif line_type in ("comment", "empty"):
                 # Match leading comments and empty lines
                 pass
             elif docstring_type in [None, "multiple_lines"]:
-                break
-            self.header.append(line)
+                return line_num
+        return len(source_lines)
+
+    @staticmethod
+    def _find_import_statements_end(source_lines: List[str], start: int) -> int:
+        """Find the end of the import statements.
 
-    def _extract_import_statements(self, source_lines: List[str]) -> None:
-        """Save the import statements from the source code into self.imports.
+        Try and except lines are only part of the import statements if an import
+        statement follows them.
 
         Args:
             source_lines: A list containing all code lines.
+            start: Index of the first line of the import statements.
+
+        Returns:
+            Index of the first line after the import statements.
         """
-        import_start_line = len(self.header)
+        import_end = start
         multiline_import = False
-        try_line: Optional[str] = None
 
-        for line in source_lines[import_start_line:]:
-            if re.match(r"^if TYPE_CHECKING:$", line):
+        for line_num in range(start, len(source_lines)):
+            line = source_lines[line_num]
+            if line == "if TYPE_CHECKING:":
                 break
-            if re.match(r"^(try|except.*):$", line):
-                try_line = line
-            elif (
-                re.match(r"^\s*(from .*)?import.[^\'\"]*$", line)
-                or line == ""
-                or multiline_import
-            ):
+            if line == "try:" or (line.startswith("except") and line.endswith(":")):
+                continue
+            if _IMPORT_LINE.match(line) or line == "" or multiline_import:
                 # Process multiline import statements
                 if "(" in line:
                     multiline_import = True
                 elif ")" in line:
                     multiline_import = False
 
-                if try_line:
-                    self.imports.append(try_line)
-                    try_line = None
-
-                self.imports.append(line)
+                import_end = line_num + 1
             else:
                 break
+        return import_end
 
-    def _extract_typing_statements(self, source_lines: List[str]) -> None:
-        """Save the typing statements from the source code into self.typing.
+    @staticmethod
+    def _find_typing_statements_end(source_lines: List[str], start: int) -> int:
+        """Find the end of the typing statements.
 
         Args:
             source_lines: A list containing all code lines.
-        """
-        typing_start_line = len(self.header) + len(self.imports)
-
-        if typing_start_line < len(source_lines) and re.match(
-            r"^if TYPE_CHECKING:$", source_lines[typing_start_line]
-        ):
-            self.typing.append(source_lines[typing_start_line])
-            typing_start_line += 1
-            for line in source_lines[typing_start_line:]:
-                if not re.match(r"^\s+.*", line) and line != "":
-                    break
-                self.typing.append(line)
-
-    def _extract_code(self, source_lines: List[str]) -> None:
-        """Save the code from the source code into self.code.
+            start: Index of the first line of the typing statements.
 
-        Args:
-            source_lines: A list containing all code lines.
+        Returns:
+            Index of the first line after the typing statements.
         """
-        # Extract the code lines
-        code_start_line = len(self.header) + len(self.imports) + len(self.typing)
-        self.code = source_lines[code_start_line:]
+        if start >= len(source_lines) or source_lines[start] != "if TYPE_CHECKING:":
+            return start
+
+        typing_end = start + 1
+        while typing_end < len(source_lines):
+            line = source_lines[typing_end]
+            if not line[:1].isspace() and line != "":
+                break
+            typing_end += 1
+        return typing_end
 
     def _join_code(self) -> str:
         """Join the source code from docstring, import statements and code lines.
 
-        Make sure that an empty line splits them.
+        Make sure that an empty line splits them. The result is cached until the
+        sections are modified.
 
         Returns:
             source_code: Source code to be corrected.
         """
+        if self._joined_code is not None:
+            return self._joined_code
+
         # Remove new lines at start and end of each section.
         sections = [
             "\n".join(section).strip()
@@ -200,43 +240,49 @@ class SourceCode:  # noqa: R090
 
         # Respect the trailing newline
         if self._trailing_newline:
-            source_code += "\n"
+            source_code = f"{source_code}\n"
 
+        self._joined_code = source_code
         return source_code
 
     @staticmethod
     def _should_ignore_line(line: str) -> bool:
         """Determine whether a line should be ignored by autoimport or not."""
-        return any(
-            [
-                re.match(r".*?# ?fmt:.*?skip.*", line),
-                re.match(r".*?# ?noqa:.*?autoimport.*", line),
-            ]
-        )
+        line = line.replace("# ", "#")
+        for marker, keyword in (("#fmt:", "skip"), ("#noqa:", "autoimport")):
+            marker_index = line.find(marker)
+            if marker_index != -1 and keyword in line[marker_index:]:
+                return True
+        return False
 
     def _move_imports_to_top(self) -> None:
         """Fix python source code to move import statements to the top of the file.
 
         Ignore the lines that contain the # noqa: autoimport string.
         """
+        # Fast path: if no code line mentions an import there is nothing to move.
+        if "import" not in "\n".join(self.code):
+            return
+
+        self._joined_code = None
         multiline_import = False
         multiline_string = False
-        code_lines_to_remove = []
+        code_lines_to_remove: Set[int] = set()
 
         for line_num, line in enumerate(self.code):
             # Process multiline strings, taking care not to catch single line strings
-            # defined with three quotes.
-            if re.match(r"^.*?(\"|\'){3}.*?(?!\1{3})$", line) and not re.match(
-                r"^.*?(\"|\'){3}.*?\1{3}", line
-            ):
+            # defined with three quotes: they open and close the string in the same
+            # line, so they have an even number of triple quotes.
+            if (line.count('"""') + line.count("'''")) % 2 == 1:
                 multiline_string = not multiline_string
                 continue
 
-            # Process import lines
+            # Process import lines, checking the line start before running the regex
             if (
                 "=" not in line
                 and not multiline_string
-                and re.match(r"^\s*(?:from .*)?import .[^\'\"]*$", line)
+                and line.lstrip().startswith(("import ", "from "))
+                and _MOVE_IMPORT.match(line)
             ) or multiline_import:
                 if self._should_ignore_line(line):
                     continue
@@ -254,19 +300,22 @@ class SourceCode:  # noqa: R090
                 elif ")" in line:
                     multiline_import = False
 
-                code_lines_to_remove.append(line)
+                code_lines_to_remove.add(line_num)
                 if not multiline_import:
                     line = line.strip()
 
                 self.imports.append(line)
 
-        for line in code_lines_to_remove:
-            self.code.remove(line)
+        self.code = [
+            line
+            for line_num, line in enumerate(self.code)
+            if line_num not in code_lines_to_remove
+        ]
 
     @staticmethod
     def _split_separation_line(line: str) -> Tuple[str, str]:
         """Split separation lines into two and return both lines back."""
-        first_line, next_line = line.split(";")
+        first_line, _, next_line = line.partition(";")
         # add correct number of leading spaces
         num_lspaces = len(first_line) - len(first_line.lstrip())
         next_line = f"{' ' * num_lspaces}{next_line.lstrip()}"
@@ -274,18 +323,22 @@ class SourceCode:  # noqa: R090
 
     def _fix_flake_import_errors(self) -> None:
         """Fix python source code to correct missed or unused import statements."""
-        error_messages = autoflake.check(self._join_code())
-        fixed_packages = []
+        error_messages = _check_source_code(self._join_code())
+        # Use a dictionary to deduplicate the names keeping their order.
+        undefined_names: Dict[str, None] = {}
+        unused_imports: List[str] = []
 
         for message in error_messages:
             if isinstance(message, (UndefinedName, UndefinedExport)):
-                object_name = message.message_args[0]
-                if object_name not in fixed_packages:
-                    self._add_package(object_name)
-                    fixed_packages.append(object_name)
+                undefined_names[message.message_args[0]] = None
             elif isinstance(message, UnusedImport):
-                import_name = message.message_args[0]
-                self._remove_unused_imports(import_name)
+                unused_imports.append(message.message_args[0])
+
+        for import_name in unused_imports:
+            self._remove_unused_imports(import_name)
+
+        for object_name in undefined_names:
+            self._add_package(object_name)
 
     def _add_package(self, object_name: str) -> None:
         """Add a package to the source code.
@@ -297,6 +350,7 @@ class SourceCode:  # noqa: R090
 
         if import_string is not None:
             self.imports.append(import_string)
+            self._joined_code = None
 
     def _find_package(self, name: str) -> Optional[str]:
         """Search package by an object's name.
@@ -314,16 +368,12 @@ class SourceCode:  # noqa: R090
         Returns:
             import_string: String required to import the package.
         """
-        for check in [
-            "_find_package_in_common_statements",
-            "_find_package_in_modules",
-            "_find_package_in_typing",
-            "_find_package_in_our_project",
-        ]:
-            package = getattr(self, check)(name)
-            if package is not None:
-                return package
-        return None
+        return (
+            self._find_package_in_common_statements(name)
+            or self._find_package_in_modules(name)
+            or self._find_package_in_typing(name)
+            or self._find_package_in_our_project(name)
+        )
 
     @staticmethod
     def _find_package_in_our_project(name: str) -> Optional[str]:
@@ -335,13 +385,8 @@ class SourceCode:  # noqa: R090
         Returns:
             import_string: String required to import the package.
         """
-        # Find the package name
-        try:
-            project_package = os.path.basename(here()).replace("-", "_")
-        except RecursionError:  # pragma: no cover
-            # I don't know how to make a test that raises this error :(
-            # To manually reproduce, follow the steps of
-            # https://github.com/lyz-code/autoimport/issues/131
+        project_package = _find_project_package()
+        if project_package is None:  # pragma: no cover
             return None
         package_objects = extract_package_objects(project_package)
 
@@ -364,11 +409,7 @@ class SourceCode:  # noqa: R090
         Returns:
             import_string: String required to import the package.
         """
-        package_specs = importlib.util.find_spec(name)
-
-        try:
-            importlib.util.module_from_spec(package_specs)  # type: ignore
-        except AttributeError:
+        if not _module_exists(name):
             return None
 
         return f"import {name}"
@@ -408,15 +449,7 @@ class SourceCode:  # noqa: R090
         Returns:
             import_string
         """
-        local_common_statements = common_statements.copy()
-        additional_statements = self._get_additional_statements()
-        if additional_statements:
-            local_common_statements.update(additional_statements)
-
-        if name in local_common_statements:
-            return local_common_statements[name]
-
-        return None
+        return self._common_statements.get(name)
 
     def _remove_unused_imports(self, import_name: str) -> None:
         """Remove unused import statements.
@@ -424,30 +457,28 @@ class SourceCode:  # noqa: R090
         Args:
             import_name: Name of the imported object to remove.
         """
+        self._joined_code = None
         package_name = ".".join(import_name.split(".")[:-1])
         object_name = import_name.split(".")[-1]
+        (
+            single_import,
+            shared_import,
+            from_import,
+            multiline_import,
+            multiline_object,
+        ) = _unused_import_patterns(package_name, object_name)
 
         for line in self.imports:
             if self._should_ignore_line(line):
                 continue
 
             # If it's the only line, remove it
-            if re.match(
-                rf"(from {package_name} )?import {object_name}( *as [a-z]+)?( *#.*)?$",
-                line,
-            ):
+            if single_import.match(line):
                 self.imports.remove(line)
                 return
             # If it shares the line with other objects, just remove the unused one.
-            if re.match(rf"from {package_name} import .*?{object_name}", line):
-                # fmt: off
-                # Format is required until there is no more need of the
-                # experimental-string-processing flag of the Black formatter.
-                match = re.match(
-                    fr"(?P<from>from {package_name} import) (?P<imports>.*)",
-                    line,
-                )
-                # fmt: on
+            if shared_import.match(line):
+                match = from_import.match(line)
                 if match is not None:
                     line_number = self.imports.index(line)
                     imports = match["imports"].split(", ")
@@ -456,34 +487,123 @@ class SourceCode:  # noqa: R090
                     self.imports[line_number] = f"{match['from']} {new_imports}"
                     return
             # If it's a multiline import statement
-            # fmt: off
-            # Format is required until there is no more need of the
-            # experimental-string-processing flag of the Black formatter.
-            elif re.match(
-                fr"from {package_name} import .*?\($",
-                line,
-            ):
-                # fmt: on
+            elif multiline_import.match(line):
                 line_number = self.imports.index(line)
                 # Remove the object name from the multiline imports
                 while line_number + 1 < len(self.imports):
                     line_number += 1
-                    if re.match(fr"\s*?{object_name},?", self.imports[line_number]):
+                    if multiline_object.match(self.imports[line_number]):
                         self.imports.pop(line_number)
                         break
 
                 # Remove the whole import if there is no other object loaded
-                if re.match(r"\s*from .* import", self.imports[line_number - 1]) \
-                        and self.imports[line_number] == ')':
+                if (
+                    _FROM_IMPORT.match(self.imports[line_number - 1])
+                    and self.imports[line_number] == ")"
+                ):
                     self.imports.pop(line_number)
                     self.imports.pop(line_number - 1)
 
                 return
 
 
+def _check_source_code(source_code: str) -> List[Message]:
+    """Run pyflakes over the source code.
+
+    The source code is parsed once and the pyflakes checker is run over the tree.
+
+    Args:
+        source_code: Source code to check.
+
+    Returns:
+        messages: pyflakes messages sorted by line number, empty if the source code
+            can't be checked.
+    """
+    try:
+        tree = ast.parse(source_code)
+        # pyflakes < 3.0 needs the source tokens to process the type comments.
+        if "type:" in source_code and hasattr(checker, "make_tokens"):
+            flake_checker = checker.Checker(
+                tree, file_tokens=checker.make_tokens(source_code)
+            )
+        else:
+            flake_checker = checker.Checker(tree)
+    except (SyntaxError, ValueError, AttributeError, RecursionError):
+        return []
+    return sorted(flake_checker.messages, key=lambda message: message.lineno)
+
+
+@lru_cache(maxsize=4096)
+def _module_exists(name: str) -> bool:
+    """Check if a module can be imported from the PYTHONPATH.
+
+    The result is cached, as the same names tend to repeat across files.
+
+    Args:
+        name: module name
+
+    Returns:
+        Whether the module exists.
+    """
+    if name in sys.modules:
+        return True
+    return importlib.util.find_spec(name) is not None
+
+
+@lru_cache(maxsize=1024)
+def _unused_import_patterns(
+    package_name: str, object_name: str
+) -> Tuple[Pattern[str], Pattern[str], Pattern[str], Pattern[str], Pattern[str]]:
+    """Compile the patterns used to find an unused import statement.
+
+    The patterns are cached, as the same unused imports tend to repeat across files.
+
+    Args:
+        package_name: Name of the package the object is imported from.
+        object_name: Name of the imported object.
+
+    Returns:
+        single_import: Matches import lines that only import the object.
+        shared_import: Matches from import lines that import more objects.
+        from_import: Splits a from import line in the from and the imports parts.
+        multiline_import: Matches the start of a multiline from import statement.
+        multiline_object: Matches the object inside a multiline import statement.
+    """
+    return (
+        re.compile(
+            rf"(from {package_name} )?import {object_name}( *as [a-z]+)?( *#.*)?$"
+        ),
+        re.compile(rf"from {package_name} import .*?{object_name}"),
+        re.compile(rf"(?P<from>from {package_name} import) (?P<imports>.*)"),
+        re.compile(rf"from {package_name} import .*?\($"),
+        re.compile(rf"\s*?{object_name},?"),
+    )
+
+
+def _find_project_package() -> Optional[str]:
+    """Find the name of the package we are developing.
+
+    It's not cached, as the project depends on the current working directory.
+
+    Returns:
+        package_name: Name of the project package, or None if it can't be found.
+    """
+    try:
+        return os.path.basename(here()).replace("-", "_")
+    except RecursionError:  # pragma: no cover
+        # I don't know how to make a test that raises this error :(
+        # To manually reproduce, follow the steps of
+        # https://github.com/lyz-code/autoimport/issues/131
+        return None
+
+
+@lru_cache(maxsize=None)
 def extract_package_objects(name: str) -> Dict[str, str]:
     """Extract the package objects and their import string.
 
+    The result is cached by package name, so the returned dictionary must not be
+    modified.
+
     Returns:
         objects: A dictionary with the object name as a key and the import string
             as the value.
@@ -492,22 +612,27 @@ def extract_package_objects(name: str) -> Dict[str, str]:
 
     # Get the modules of the desired package
     try:
-        package_modules = [__import__(name)]
+        package = __import__(name)
 
     except ModuleNotFoundError:
         return package_objects
-    package_modules.extend(
-        [
-            module[1]
-            for module in inspect.getmembers(package_modules[0], inspect.ismodule)
+    # Use a dictionary to scan each module once even if it's bound to several names,
+    # keeping their order.
+    package_modules = dict.fromkeys(
+        [package]
+        + [
+            package_object
+            for _, package_object in sorted(vars(package).items())
+            if inspect.ismodule(package_object)
         ]
     )
 
-    # Get objects of the package
+    # Get objects of the package. Read the module namespaces directly, as
+    # inspect.getmembers resolves every attribute returned by dir().
     for module in package_modules:
-        for package_object_tuple in inspect.getmembers(module):
-            object_name = package_object_tuple[0]
-            package_object = package_object_tuple[1]
+        for object_name, package_object in sorted(vars(module).items()):
+            if object_name.startswith("__"):
+                continue
             # If the object is a function or a class
             if inspect.isfunction(package_object) or inspect.isclass(package_object):
                 if (
@@ -525,7 +650,7 @@ def extract_package_objects(name: str) -> Dict[str, str]:
                             object_name
                         ] = f"from {package_object.__module__} import {object_name}"
 
-            elif not re.match(r"^_.*", object_name):
+            elif not object_name.startswith("_"):
                 # The rest of objects
                 package_objects[
                     object_name
@@ -4,12 +4,21 @@ Classes and functions that connect the different domain model objects with the a
 and handlers to achieve the program's purpose.
 """
 
-from typing import Any, Dict, Optional, Tuple
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Any, Dict, List, Optional, Tuple
 
 from _io import TextIOWrapper
 
 from autoimport.model import SourceCode
 
+# Starting the worker processes takes tens of milliseconds and they start with
+# empty caches, so the pool is only used when there is enough code to pay it off.
+_PARALLEL_MIN_FILES = 4
+_PARALLEL_MIN_SIZE = 200_000
+_CPU_COUNT = os.cpu_count() or 1
+
 
 def fix_files(
     files: Tuple[TextIOWrapper, ...], config: Optional[Dict[str, Any]] = None
@@ -18,16 +27,18 @@ def fix_files(
 
     If the input is taken from stdin, it will output the value to stdout.
 
+    When there are many files, they are fixed in parallel processes.
+
     Args:
         files: List of files to fix.
 
     Returns:
         Fixed code retrieved from stdin or None.
     """
-    for file_wrapper in files:
-        source = file_wrapper.read()
-        fixed_source = fix_code(source, config)
+    sources = [file_wrapper.read() for file_wrapper in files]
+    fixed_sources = _fix_sources(sources, config)
 
+    for file_wrapper, source, fixed_source in zip(files, sources, fixed_sources):
         if fixed_source == source:
             continue
 
@@ -55,6 +66,38 @@ def fix_files(
     return None
 
 
+def _fix_sources(
+    sources: List[str], config: Optional[Dict[str, Any]] = None
+) -> List[str]:
+    """Fix the python source code of a list of sources.
+
+    The sources are independent of each other, so if there are enough of them,
+    they are fixed in a pool of processes.
+
+    Args:
+        sources: List of source codes to fix.
+
+    Returns:
+        Fixed source codes, in the same order as the sources.
+    """
+    max_workers = min(len(sources), _CPU_COUNT)
+    if (
+        max_workers >= 2
+        and len(sources) >= _PARALLEL_MIN_FILES
+        and sum(len(source) for source in sources) >= _PARALLEL_MIN_SIZE
+    ):
+        try:
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+        except (OSError, NotImplementedError):
+            # Platforms without working semaphores can't create the pool.
+            pass
+        else:
+            with executor:
+                return list(executor.map(fix_code, sources, repeat(config)))
+
+    return [fix_code(source, config) for source in sources]
+
+
 def fix_code(original_source_code: str, config: Optional[Dict[str, Any]] = None) -> str:
     """Fix python source code to correct import statements.
 
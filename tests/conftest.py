@@ -5,6 +5,16 @@ import pathlib
 import pytest
 from py._path.local import LocalPath
 
+from autoimport import model
+
+
+@pytest.fixture(autouse=True)
+def _clear_caches() -> None:
+    """Clear the autoimport caches so that the tests don't share state."""
+    model.extract_package_objects.cache_clear()
+    model._module_exists.cache_clear()  # noqa: W0212
+    model._unused_import_patterns.cache_clear()  # noqa: W0212
+
 
 @pytest.fixture()
 def test_dir(tmpdir: LocalPath) -> pathlib.Path:
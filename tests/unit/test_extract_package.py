@@ -1,6 +1,11 @@
 """Test the extraction of package objects."""
 
+from pathlib import Path
+
+import pytest
+
 from autoimport.model import extract_package_objects
+from autoimport.services import fix_code
 
 
 def test_extraction_returns_the_package_functions() -> None:
@@ -61,3 +66,26 @@ def test_extraction_returns_empty_dict_if_package_is_not_importable() -> None:
     result = extract_package_objects("inexistent")
 
     assert not result
+
+
+def test_extraction_follows_the_project_of_the_working_directory(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    Given: Two projects, each one with its own package.
+    When: fix code is run from one project and then from the other.
+    Then: The objects are imported from the package of the current project.
+    """
+    for project in ("project_a", "project_b"):
+        package_dir = tmp_path / project / project
+        package_dir.mkdir(parents=True)
+        (tmp_path / project / "pyproject.toml").write_text("")
+        (package_dir / "__init__.py").write_text(f"def hello_{project}():\n    pass\n")
+        monkeypatch.syspath_prepend(str(tmp_path / project))
+    monkeypatch.chdir(tmp_path / "project_a")
+    fix_code("hello_project_a()")
+    monkeypatch.chdir(tmp_path / "project_b")
+
+    result = fix_code("hello_project_b()")
+
+    assert result == "from project_b import hello_project_b\n\nhello_project_b()"
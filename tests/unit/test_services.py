@@ -1,11 +1,16 @@
 """Tests the service layer."""
 
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 from textwrap import dedent
+from typing import List
 
 import pytest
+from pyflakes import __version__ as pyflakes_version
 
+from autoimport import services
 from autoimport.model import common_statements
-from autoimport.services import fix_code
+from autoimport.services import fix_code, fix_files
 
 
 def test_fix_code_adds_missing_import() -> None:
@@ -343,6 +348,115 @@ def test_fix_respects_import_lines_in_multiple_line_strings() -> None:
     assert result == fixed_source
 
 
+def test_fix_moves_import_line_repeated_inside_a_multiline_string() -> None:
+    """
+    Given: An import line that also appears inside a previous multiline string.
+    When: Fix code is run.
+    Then: Only the import statement outside the string is moved to the top.
+    """
+    source = dedent(
+        """\
+        import os
+
+        print(os.getcwd())
+        text = \"\"\"
+        import requests
+        \"\"\"
+        import requests
+        requests.get(text)"""
+    )
+    fixed_source = dedent(
+        """\
+        import os
+
+        import requests
+
+        print(os.getcwd())
+        text = \"\"\"
+        import requests
+        \"\"\"
+        requests.get(text)"""
+    )
+
+    result = fix_code(source)
+
+    assert result == fixed_source
+
+
+def test_fix_moves_import_statements_after_lines_with_mixed_quotes() -> None:
+    """
+    Given: A line with three consecutive quotes of different types.
+    When: Fix code is run.
+    Then: It's not mistaken with the start of a multiline string, and the next
+        import statement is moved to the top.
+    """
+    source = dedent(
+        """\
+        def quote(text):
+            text = text.replace("'", '"')
+            import os
+            return os.sep, text"""
+    )
+    fixed_source = dedent(
+        """\
+        import os
+
+        def quote(text):
+            text = text.replace("'", '"')
+            return os.sep, text"""
+    )
+
+    result = fix_code(source)
+
+    assert result == fixed_source
+
+
+@pytest.mark.skipif(
+    int(pyflakes_version.split(".", maxsplit=1)[0]) >= 3,
+    reason="pyflakes >= 3.0 doesn't support type comments",
+)
+def test_fix_respects_imports_used_in_type_comments() -> None:
+    """
+    Given: An import statement only used in a type comment.
+    When: Fix code is run.
+    Then: The import statement is not removed.
+    """
+    source = dedent(
+        """\
+        from typing import List
+
+        names = []  # type: List[str]"""
+    )
+
+    result = fix_code(source)
+
+    assert result == source
+
+
+def test_fix_code_with_type_in_the_source() -> None:
+    """
+    Given: A source code that contains the text `type:` outside a type comment.
+    When: Fix code is run.
+    Then: The missing import statement is added.
+    """
+    source = dedent(
+        """\
+        def check(type: str) -> None:
+            os.getcwd()"""
+    )
+    fixed_source = dedent(
+        """\
+        import os
+
+        def check(type: str) -> None:
+            os.getcwd()"""
+    )
+
+    result = fix_code(source)
+
+    assert result == fixed_source
+
+
 def test_fix_moves_import_statements_to_the_top() -> None:
     """Move import statements present in the source code to the top of the file"""
     source = dedent(
@@ -1106,3 +1220,83 @@ def test_file_with_import_and_seperator_indentation() -> None:
     result = fix_code(source)
 
     assert result == expected
+
+
+def test_file_with_import_and_several_seperators() -> None:
+    """Ensure import lines with more than one seperator only split the first one."""
+    source = dedent(
+        """\
+        def say_hi():
+            import os; print(os.sep); print(os.getcwd())"""
+    )
+    expected = dedent(
+        """\
+        import os
+
+        def say_hi():
+            print(os.sep); print(os.getcwd())"""
+    )
+
+    result = fix_code(source)
+
+    assert result == expected
+
+
+def test_fix_files_in_parallel(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Given: Enough files to fix them in a pool of processes.
+    When: Fix files is run.
+    Then: The files are fixed in the pool.
+    """
+    pools: List[ProcessPoolExecutor] = []
+
+    class RecordingPool(ProcessPoolExecutor):
+        """Process pool that records its instances."""
+
+        def __init__(self, max_workers: int) -> None:
+            super().__init__(max_workers=max_workers)
+            pools.append(self)
+
+    monkeypatch.setattr(services, "ProcessPoolExecutor", RecordingPool)
+    monkeypatch.setattr(services, "_PARALLEL_MIN_FILES", 2)
+    monkeypatch.setattr(services, "_PARALLEL_MIN_SIZE", 0)
+    monkeypatch.setattr(services, "_CPU_COUNT", 2)
+    paths = [tmp_path / f"source_{file_number}.py" for file_number in range(3)]
+    for path in paths:
+        path.write_text("os.getcwd()")
+    files = tuple(path.open("r+") for path in paths)
+
+    result = fix_files(files)
+
+    assert result is None
+    assert len(pools) == 1
+    for path in paths:
+        assert path.read_text() == "import os\n\nos.getcwd()"
+
+
+def test_fix_files_without_process_pool_support(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    Given: A platform where the pool of processes can't be created.
+    When: Fix files is run with enough files to use the pool.
+    Then: The files are fixed one after the other.
+    """
+
+    def broken_pool(max_workers: int) -> ProcessPoolExecutor:
+        raise NotImplementedError
+
+    monkeypatch.setattr(services, "ProcessPoolExecutor", broken_pool)
+    monkeypatch.setattr(services, "_PARALLEL_MIN_FILES", 2)
+    monkeypatch.setattr(services, "_PARALLEL_MIN_SIZE", 0)
+    monkeypatch.setattr(services, "_CPU_COUNT", 2)
+    paths = [tmp_path / f"source_{file_number}.py" for file_number in range(3)]
+    for path in paths:
+        path.write_text("os.getcwd()")
+    files = tuple(path.open("r+") for path in paths)
+
+    result = fix_files(files)
+
+    assert result is None
+    for path in paths:
+        assert path.read_text() == "import os\n\nos.getcwd()"